@@ -1,17 +1,95 @@
-from pprint import pprint
+import logging
+from pprint import pformat
 
 import requests
+from requests.adapters import HTTPAdapter
 
 from ..common.logger import get_logger
 
 logger = get_logger(__name__)
 
+# Code templates for each skill, filled with the target position
+_GOTO_TPL = "path = plan_mobile_path({pos})\nresult = follow_mobile_path(path)\n"
+_PICK_TPL = "result = pick_object({pos}, 0.1, 0.2)\n"
+_PLACE_TPL = "result = place_object({pos}, 0.1, 0.2)\n"
+
 
 class TaskExecutor:
-    def __init__(self, url="http://127.0.0.1:8800"):
-        response = requests.get(f"{url}/env")
-        self.object_map = response.json().get("objects", [])
+    def __init__(self, url="http://127.0.0.1:8800", code_repository=None):
+        """
+        Args:
+            url: Simulator server URL, used when no code_repository is given
+            code_repository: Simulator's code_repository module when running
+                in the same process; code is then executed directly instead
+                of being posted to /send_action. exec_code serializes on
+                code_repository's robot lock, so this is safe next to the
+                llm_main action processor, but plans then interleave with
+                queued actions rather than waiting behind them
+        """
         self.url = url
+        self.code_repository = code_repository
+        self.session = None
+
+        if code_repository is None:
+            # Keep-alive session so every subtask reuses the same socket
+            self.session = requests.Session()
+            self.session.mount(
+                "http://",
+                HTTPAdapter(pool_connections=1, pool_maxsize=16, max_retries=0),
+            )
+
+        # Object map is fetched on first use and revalidated per execute()
+        self._object_map = None
+        self._object_names_cached = ()
+        self._env_etag = None
+
+    @property
+    def object_map(self):
+        if self._object_map is None:
+            self.refresh_object_map()
+        return self._object_map
+
+    def refresh_object_map(self):
+        """Reload the object map, skipping the download when /env is unchanged."""
+        objects = self._fetch_objects()
+        if objects is None:
+            return self._object_map
+
+        # /env returns objects keyed by name; index a plain list the same way
+        if isinstance(objects, list):
+            objects = {obj["name"]: obj for obj in objects}
+        self._object_map = objects
+        # Only read when a target is missing; computed once per refresh
+        self._object_names_cached = tuple(sorted(objects))
+        return self._object_map
+
+    def _fetch_objects(self):
+        """Return the current objects, or None if the cached map is still valid."""
+        if self.code_repository is not None:
+            # Same snapshot as the simulator's /env endpoint
+            return self.code_repository.get_environment_objects()
+
+        headers = {}
+        if self._object_map is not None and self._env_etag:
+            headers["If-None-Match"] = self._env_etag
+        response = self.session.get(f"{self.url}/env", headers=headers)
+        if response.status_code == 304:
+            return None
+        if response.status_code != 200:
+            # Keep the cached map and ETag; only a 200 carries a fresh snapshot
+            raise RuntimeError(f"GET {self.url}/env failed with status {response.status_code}")
+        self._env_etag = response.headers.get("ETag")
+        return response.json().get("objects", {})
+
+    def close(self):
+        if self.session is not None:
+            self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
     def _make_task_sequence(self, task_outputs):
         task_sequence = []
@@ -25,81 +103,68 @@ class TaskExecutor:
         return task_sequence
 
     def _go_to_object(self, target):
-        pos = target["pos"]
-        payload = {
-            "action": {
-                "type": "run_code",
-                "payload": {
-                    "code": f"""
-path = plan_mobile_path({pos})
-result = follow_mobile_path(path)
-"""
-                },
-            }
-        }
-        response = requests.post(f"{self.url}/send_action", json=payload)
-        objects = response.json()["result"]
-        print(objects)
+        return _GOTO_TPL.format(pos=target["pos"])
 
     def _pick_object(self, target):
-        pos = target["pos"]
-        payload = {
-            "action": {
-                "type": "run_code",
-                "payload": {
-                    "code": f"""
-result = pick_object({pos}, 0.1, 0.2)
-"""
-                },
-            }
-        }
-        response = requests.post(f"{self.url}/send_action", json=payload)
-        objects = response.json()["result"]
-        print(objects)
+        return _PICK_TPL.format(pos=target["pos"])
 
     def _place_object(self, target):
-        pos = target["pos"]
-        payload = {
-            "action": {
-                "type": "run_code",
-                "payload": {
-                    "code": f"""
-result = place_object({pos}, 0.1, 0.2)
-"""
-                },
-            }
-        }
-        response = requests.post(f"{self.url}/send_action", json=payload)
-        objects = response.json()["result"]
-        print(objects)
+        return _PLACE_TPL.format(pos=target["pos"])
 
-    def execute(self, task_outputs):
-        task_sequence = self._make_task_sequence(task_outputs)
-        logger.info("Executing task sequence:")
-        pprint(task_sequence)
-
-        results = []
+    def _build_batch_code(self, task_sequence):
+        """Join the code of every task so the whole plan runs in one action."""
+        codes = []
         for task in task_sequence:
-            logger.info(f"Executing task: {task}")
-            
+            logger.info("Planned task: %s", task)
+
             # Validate target object exists
             target_name = task["target"]
             if target_name not in self.object_map:
-                available_objects = list(self.object_map.keys())
-                error_msg = f"Object '{target_name}' not found. Available objects: {available_objects}"
+                error_msg = f"Object {target_name!r} not found; available: {self._object_names_cached}"
                 logger.error(error_msg)
                 raise KeyError(error_msg)
-            
+
             target = self.object_map[target_name]
-            
+
             if task["skill"] == "GoToObject":
-                self._go_to_object(target)
+                codes.append(self._go_to_object(target))
             elif task["skill"] == "PickObject":
-                self._pick_object(target)
+                codes.append(self._pick_object(target))
             elif task["skill"] == "PlaceObject":
-                self._place_object(target)
+                codes.append(self._place_object(target))
             else:
                 raise ValueError(f"Unknown skill: {task['skill']}")
+
+        return "".join(codes)
+
+    def _exec(self, code):
+        if self.code_repository is not None:
+            result = self.code_repository.exec_code(code)
+            logger.debug("result=%s", result)
+            return
+
+        payload = {
+            "action": {
+                "type": "run_code",
+                "payload": {"code": code},
+            }
+        }
+        response = self.session.post(f"{self.url}/send_action", json=payload)
+        objects = response.json()["result"]
+        logger.debug("result=%s", objects)
+
+    def execute(self, task_outputs):
+        task_sequence = self._make_task_sequence(task_outputs)
+        self.refresh_object_map()
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Executing task sequence:\n%s", pformat(task_sequence))
+
+        # One action for the whole plan, so the robot runs it in order.
+        # The code is built first so an invalid task fails before anything runs.
+        self._exec(self._build_batch_code(task_sequence))
+
+        results = []
+        for task in task_sequence:
             task_result = task.copy()
             task_result["result"] = "Ok"
             results.append(task_result)
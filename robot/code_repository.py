@@ -1,5 +1,6 @@
 """Sandboxed code execution layer for robot control with waiting logic."""
 
+import threading
 import time
 import numpy as np
 from simulator import MujocoSimulator
@@ -11,6 +12,18 @@ simulator: MujocoSimulator = None
 # Optional voice feedback callback
 voice_callback = None
 
+# Only one thread drives the robot at a time, whatever the caller
+# (action processor, /send_action threadpool, in-process TaskExecutor)
+_robot_lock = threading.Lock()
+
+
+def get_environment_objects():
+    """Object poses as JSON-ready lists, without modifying the simulator's data."""
+    return {
+        name: {**obj, "pos": obj["pos"].tolist(), "ori": obj["ori"].tolist()}
+        for name, obj in simulator.get_object_positions().items()
+    }
+
 
 def set_target_position(x, y, theta, wait=True):
     """
@@ -229,10 +242,40 @@ def cooperative_move(target_x, target_y):
     print("✅ Cooperative move complete!")
 
 
+# Functions exposed to sandboxed code and to direct "call" actions
+SANDBOX_FUNCTIONS = {
+    "set_target_position": set_target_position,
+    "add_obstacle": add_obstacle,
+    "clear_obstacles": clear_obstacles,
+    "get_obstacle_info": get_obstacle_info,
+    "get_current_position": get_current_position,
+    "get_safe_start_point": get_safe_start_point,
+    "get_safe_target": get_safe_target,
+    "move_agent_b": move_agent_b,
+    "spiral_search": spiral_search,
+    "cooperative_move": cooperative_move,
+}
+
+
+# Sandbox globals and builtins templates, both copied per execution so
+# runs don't share state
+_SANDBOX_BUILTINS = {"print": print, "range": range, "float": float, "time": time, "len": len, "abs": abs}
+_SANDBOX_GLOBALS = {
+    "PI": np.pi,
+    **SANDBOX_FUNCTIONS,
+}
+
+# Compiled code objects keyed by source, capped to bound memory
+_COMPILED = {}
+_COMPILED_MAX = 512
+
+
 def exec_code(code):
     """
     Execute user code in sandboxed environment with robot control access.
 
+    Repeated code strings reuse their compiled code object.
+
     Args:
         code: Python code string to execute
 
@@ -245,19 +288,33 @@ def exec_code(code):
           - clear_obstacles()
           - get_obstacle_info()
     """
-    # Define sandboxed environment with limited access
-    safe_globals = {
-        "__builtins__": {"print": print, "range": range, "float": float, "time": time, "len": len, "abs": abs},
-        "PI": np.pi,
-        "set_target_position": set_target_position,
-        "add_obstacle": add_obstacle,
-        "clear_obstacles": clear_obstacles,
-        "get_obstacle_info": get_obstacle_info,
-        "get_current_position": get_current_position,
-        "get_safe_start_point": get_safe_start_point,
-        "get_safe_target": get_safe_target,
-        "move_agent_b": move_agent_b,
-        "spiral_search": spiral_search,
-        "cooperative_move": cooperative_move,
-    }
-    exec(code, safe_globals)
+    compiled = _COMPILED.get(code)
+    if compiled is None:
+        compiled = compile(code, "<action>", "exec")
+        if len(_COMPILED) < _COMPILED_MAX:
+            _COMPILED[code] = compiled
+    with _robot_lock:
+        exec(compiled, {**_SANDBOX_GLOBALS, "__builtins__": dict(_SANDBOX_BUILTINS)})
+
+
+def call_function(fn, args=None, kwargs=None):
+    """
+    Call a sandbox function by name without compiling any code.
+
+    Args:
+        fn: Name of a function in SANDBOX_FUNCTIONS
+        args: List of positional arguments
+        kwargs: Dict of keyword arguments
+
+    Returns:
+        The function's return value
+    """
+    if fn not in SANDBOX_FUNCTIONS:
+        raise ValueError(f"Unknown function: {fn}")
+    args = [] if args is None else args
+    if not isinstance(args, list):
+        raise TypeError(f"args must be a list, got {type(args).__name__}")
+    if kwargs is not None and not isinstance(kwargs, dict):
+        raise TypeError(f"kwargs must be a dict, got {type(kwargs).__name__}")
+    with _robot_lock:
+        return SANDBOX_FUNCTIONS[fn](*args, **(kwargs or {}))
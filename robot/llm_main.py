@@ -3,12 +3,18 @@ LLM-Enhanced FastAPI server for MuJoCo robot simulation
 Extends main.py with natural language control capabilities
 """
 
-import queue
+import asyncio
+import hashlib
+import logging
 import threading
+import time
+import traceback
+from collections import OrderedDict, deque
 import uvicorn
-from fastapi import FastAPI, Response, status
-from fastapi.responses import JSONResponse, HTMLResponse
+from fastapi import FastAPI, Request, Response, status
+from fastapi.responses import ORJSONResponse, HTMLResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from dotenv import load_dotenv
 from simulator import MujocoSimulator
 from llm_agent import LLMRobotAgent
@@ -17,6 +23,8 @@ import code_repository
 # Load environment variables from .env file
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 
 # Server configuration
 HOST = "0.0.0.0"
@@ -27,7 +35,8 @@ VERSION = "0.0.2-LLM"
 app = FastAPI(
     title="LLM-Enabled MuJoCo Robot Simulator",
     description="Control Panda-Omron mobile robot via natural language (GPT-4)",
-    version=VERSION
+    version=VERSION,
+    default_response_class=ORJSONResponse
 )
 
 # CORS middleware
@@ -39,47 +48,142 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress larger responses such as the /ui page
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
 # Create simulator and LLM agent
 simulator = MujocoSimulator()
 code_repository.simulator = simulator
 llm_agent = LLMRobotAgent()
 
-# Action queue
-actions_queue = queue.Queue()
+# Action queue: deque append/popleft are atomic, the event wakes the processor
+actions_queue = deque()
+actions_ready = threading.Event()
 
 
-def process_actions():
-    """Process action queue in background thread."""
-    print("Action processor started...")
-    while True:
+# Generated code cache: (command, model, system prompt) -> code.
+# Cached entries are generated single-turn, so they never depend on the
+# conversation they were first produced in.
+_CODE_CACHE = OrderedDict()
+_CODE_CACHE_MAX = 256
+_code_cache_lock = threading.Lock()
+# Held while a cache miss swaps out the conversation history
+_generation_lock = threading.Lock()
+
+
+def _cache_key(user_command):
+    # Model/prompt changes on llm_agent at runtime miss the old entries
+    return (user_command.strip().lower(), llm_agent.model, llm_agent.system_prompt)
+
+
+def _generate_single_turn(user_command):
+    """Generate code with an empty conversation, then record the turn in the real one."""
+    with _generation_lock:
+        history = llm_agent.conversation_history
+        llm_agent.conversation_history = []
         try:
-            action = actions_queue.get(timeout=0.1)
-            action = action["action"]
+            generated_code = llm_agent.generate_code(user_command)
+        finally:
+            llm_agent.conversation_history = history
+    return generated_code
 
-            print(f"\n{'='*60}")
-            print(f"Received Action:", action)
 
-            if action["type"] == "run_code":
-                code_str = action["payload"].get("code")
+def generate_code(user_command, use_cache=True):
+    """
+    Generate code for a command, reusing earlier output for repeated commands.
+
+    With use_cache the command is generated single-turn, without the
+    conversation history, and the result is cached. Pass use_cache=False
+    for commands that depend on earlier turns ("one more time", ...).
+    """
+    if not use_cache:
+        return llm_agent.generate_code(user_command)
+
+    key = _cache_key(user_command)
+    with _code_cache_lock:
+        generated_code = _CODE_CACHE.get(key)
+        if generated_code is not None:
+            _CODE_CACHE.move_to_end(key)
+
+    if generated_code is None:
+        generated_code = _generate_single_turn(user_command)
+        if generated_code.startswith("# ERROR"):
+            return generated_code
+        with _code_cache_lock:
+            _CODE_CACHE[key] = generated_code
+            if len(_CODE_CACHE) > _CODE_CACHE_MAX:
+                _CODE_CACHE.popitem(last=False)
+
+    # Keep the conversation complete for later uncached, multi-turn commands
+    llm_agent.conversation_history.extend([
+        {"role": "user", "content": user_command},
+        {"role": "assistant", "content": generated_code},
+    ])
+    return generated_code
+
+
+def run_code(code_str):
+    """Execute one code string, logging errors without stopping the processor."""
+    try:
+        code_repository.exec_code(code_str)
+        logger.info("Code execution completed successfully")
+    except Exception as e:
+        logger.exception("[EXECUTION ERROR] %s: %s", type(e).__name__, e)
+
+
+def run_action(action):
+    """Dispatch a single action by type."""
+    logger.info("Received Action: %s", action)
+
+    if action["type"] == "run_code":
+        run_code(action["payload"].get("code"))
+    elif action["type"] == "run_code_batch":
+        # Several code strings dispatched through a single queue item
+        for code_str in action["payload"].get("codes", []):
+            run_code(code_str)
+    elif action["type"] == "call":
+        payload = action["payload"]
+        code_repository.call_function(
+            payload.get("fn"), payload.get("args", []), payload.get("kwargs")
+        )
+        logger.info("Call completed successfully")
+
+
+def process_actions():
+    """Process action queue in background thread."""
+    logger.info("Action processor started...")
+    while True:
+        actions_ready.wait()
+        actions_ready.clear()
+
+        # Drain everything queued since the last wakeup in one pass
+        batch = []
+        while actions_queue:
+            batch.append(actions_queue.popleft())
+        stop = None in batch
+        if stop:
+            batch = batch[:batch.index(None)]
+
+        if batch:
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("=" * 60)
+            for action in batch:
                 try:
-                    code_repository.exec_code(code_str)
-                    print("Code execution completed successfully")
+                    run_action(action["action"])
                 except Exception as e:
-                    print(f"\n[EXECUTION ERROR]")
-                    print(f"  Type: {type(e).__name__}")
-                    print(f"  Message: {e}")
-                    import traceback
-                    traceback.print_exc()
-            print(f"{'='*60}\n")
+                    logger.exception("Error processing action: %s", e)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("=" * 60)
 
-            actions_queue.task_done()
+        if stop:
+            logger.info("Action processor stopped")
+            return
 
-        except queue.Empty:
-            continue
-        except Exception as e:
-            print(f"Error processing action: {e}")
-            import traceback
-            traceback.print_exc()
+
+def stop_action_processor():
+    """Wake the processor with a None sentinel so its loop exits."""
+    actions_queue.append(None)
+    actions_ready.set()
 
 
 def run_simulator():
@@ -98,7 +202,6 @@ def run_simulator():
             print(f"\n⚠️  Simulator error: {e}\n")
     except Exception as e:
         print(f"\n⚠️  Simulator error: {e}\n")
-        import traceback
         traceback.print_exc()
 
 
@@ -114,7 +217,7 @@ def read_root():
 
 
 @app.post("/send_action")
-def receive_action(action: dict):
+async def receive_action(action: dict):
     """
     Queue action for execution (original endpoint).
 
@@ -125,28 +228,35 @@ def receive_action(action: dict):
                 "payload": {"code": "set_target_position(0, 0, PI)"}
             }
         }
+
+    Use type "run_code_batch" with payload {"codes": [...]} to run several
+    code strings in order as one queued action, or type "call" with payload
+    {"fn": "set_target_position", "args": [1, 0, 0]} to call a sandbox
+    function directly without compiling code.
     """
     if "action" in action and "type" in action["action"] and "payload" in action["action"]:
-        actions_queue.put(action)
-        return JSONResponse(
+        actions_queue.append(action)
+        actions_ready.set()
+        return ORJSONResponse(
             status_code=status.HTTP_200_OK,
             content={"status": "success", "action_feedback": "good"}
         )
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=status.HTTP_400_BAD_REQUEST,
         content={"status": "error", "message": "Invalid action format"}
     )
 
 
 @app.post("/llm_command")
-def llm_command(request: dict):
+async def llm_command(request: dict):
     """
     🤖 NEW: Natural language command endpoint (LLM-powered)
 
     Expected format:
         {
             "command": "정사각형으로 움직여줘",
-            "execute": true  # Optional: auto-execute generated code
+            "execute": true,  # Optional: auto-execute generated code
+            "no_cache": false  # Optional: skip the cache and use the conversation history
         }
 
     Returns:
@@ -160,9 +270,10 @@ def llm_command(request: dict):
     try:
         user_command = request.get("command", "")
         auto_execute = request.get("execute", True)
+        use_cache = not request.get("no_cache", False)
 
         if not user_command:
-            return JSONResponse(
+            return ORJSONResponse(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 content={"status": "error", "message": "No command provided"}
             )
@@ -170,13 +281,14 @@ def llm_command(request: dict):
         # LLM으로 코드 생성
         print(f"\n{'='*60}")
         print(f"🤖 LLM Command: {user_command}")
-        generated_code = llm_agent.generate_code(user_command)
+        # Run the blocking OpenAI call off the event loop
+        generated_code = await asyncio.to_thread(generate_code, user_command, use_cache)
         print(f"Generated Code:\n{generated_code}")
         print(f"{'='*60}\n")
 
         # 에러 체크
         if generated_code.startswith("# ERROR"):
-            return JSONResponse(
+            return ORJSONResponse(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 content={
                     "status": "error",
@@ -188,15 +300,16 @@ def llm_command(request: dict):
         # 자동 실행 옵션
         executed = False
         if auto_execute:
-            actions_queue.put({
+            actions_queue.append({
                 "action": {
                     "type": "run_code",
                     "payload": {"code": generated_code}
                 }
             })
+            actions_ready.set()
             executed = True
 
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=status.HTTP_200_OK,
             content={
                 "status": "success",
@@ -207,8 +320,7 @@ def llm_command(request: dict):
         )
 
     except Exception as e:
-        import traceback
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             content={
                 "status": "error",
@@ -218,10 +330,8 @@ def llm_command(request: dict):
         )
 
 
-@app.get("/ui", response_class=HTMLResponse)
-def get_ui():
-    """Simple web UI for LLM robot control"""
-    return """
+# Web UI page, encoded and hashed once at import time
+_UI_HTML = """
 <!DOCTYPE html>
 <html lang="ko">
 <head>
@@ -510,12 +620,25 @@ def get_ui():
 </body>
 </html>
     """
+_UI_BYTES = _UI_HTML.encode("utf-8")
+_UI_ETAG = f'"{hashlib.md5(_UI_BYTES).hexdigest()}"'
+
+
+@app.get("/ui", response_class=HTMLResponse)
+def get_ui(request: Request):
+    """Simple web UI for LLM robot control"""
+    headers = {"ETag": _UI_ETAG, "Cache-Control": "public, max-age=3600"}
+    if request.headers.get("if-none-match") == _UI_ETAG:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=_UI_BYTES, media_type="text/html", headers=headers)
 
 
 def main():
     """
     Start simulator, action processor, and FastAPI server.
     """
+    logging.basicConfig(level=logging.INFO)
+
     # Start background threads
     print("🔧 Starting background threads...")
     sim_thread = threading.Thread(target=run_simulator, daemon=True)
@@ -525,7 +648,6 @@ def main():
     action_thread.start()
     
     # Give threads time to initialize
-    import time
     time.sleep(0.5)
     
     print("🔧 Threads started. Checking status...")
@@ -549,6 +671,10 @@ def main():
     # Start server
     uvicorn.run(app, host=HOST, port=PORT, log_level="info")
 
+    # Server stopped: let the processor finish queued actions before exiting
+    stop_action_processor()
+    action_thread.join(timeout=30)
+
 
 if __name__ == "__main__":
     main()
@@ -1,11 +1,13 @@
 """FastAPI server for MuJoCo robot simulation with REST API control."""
 
 import time
+import json
+import hashlib
 import queue
 import threading
 import uvicorn
 from typing import Dict, Any, Optional
-from fastapi import FastAPI, Response, status
+from fastapi import FastAPI, Request, Response, status
 from simulator import MujocoSimulator
 import code_repository
 
@@ -30,19 +32,24 @@ code_repository.simulator = simulator
 def process_actions(action: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     """Process action."""
     RESULT = {}
-    if action["type"] == "run_code":
-        code_str = action["payload"].get("code")
-        try:
-            RESULT = code_repository.exec_code(code_str)
+    payload = action["payload"]
+    try:
+        if action["type"] == "run_code":
+            RESULT = code_repository.exec_code(payload.get("code"))
             print(f"Code execution completed: {RESULT}")
-        except Exception as e:
-            # Log errors without crashing the simulator
-            print(f"\n[EXECUTION ERROR]")
-            print(f"  Type: {type(e).__name__}")
-            print(f"  Message: {e}")
-            import traceback
-            print(f"\n[TRACEBACK]")
-            traceback.print_exc()
+        elif action["type"] == "call":
+            RESULT = code_repository.call_function(
+                payload.get("fn"), payload.get("args", []), payload.get("kwargs")
+            )
+            print(f"Call completed: {RESULT}")
+    except Exception as e:
+        # Log errors without crashing the simulator
+        print(f"\n[EXECUTION ERROR]")
+        print(f"  Type: {type(e).__name__}")
+        print(f"  Message: {e}")
+        import traceback
+        print(f"\n[TRACEBACK]")
+        traceback.print_exc()
     print("=" * 60 + "\n")
     return RESULT
 
@@ -59,16 +66,25 @@ def read_root() -> Dict[str, str]:
 
 
 @app.get("/env")
-def get_environment():
+def get_environment(request: Request) -> Response:
     """Collect environment snapshot with object poses and robot state."""
-    objects = simulator.get_object_positions()
-    for obj in objects.values():
-        obj['pos'] = obj['pos'].tolist()
-        obj['ori'] = obj['ori'].tolist()
-    return {
-        "timestamp": time.time(),
-        "objects": objects,
-    }
+    objects = code_repository.get_environment_objects()
+
+    # ETag over the objects only, so an unchanged scene answers 304
+    # without building the body
+    objects_json = json.dumps(objects, sort_keys=True).encode("utf-8")
+    etag = '"' + hashlib.md5(objects_json).hexdigest() + '"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+    # Same encoding as FastAPI's JSONResponse (object order kept, NaN rejected)
+    content = json.dumps(
+        {"timestamp": time.time(), "objects": objects},
+        ensure_ascii=False,
+        allow_nan=False,
+        separators=(",", ":"),
+    ).encode("utf-8")
+    return Response(content=content, media_type="application/json", headers={"ETag": etag})
 
 
 @app.post("/send_action")
@@ -83,6 +99,9 @@ def receive_action(payload: Dict[str, Any]) -> Dict[str, Any]:
                 "payload": {"code": "get_mobile_target_joint([0, 0, PI])"}
             }
         }
+
+    Type "call" runs one sandbox function directly, e.g.
+    {"type": "call", "payload": {"fn": "set_target_position", "args": [1, 0, 0]}}
     """
     # Validate action format
     if "action" in payload and "type" in payload["action"] and "payload" in payload["action"]:
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+Generated code cache test for /llm_command (no OpenAI call).
+Run from the robot/ directory: python test_llm_cache.py
+"""
+
+import asyncio
+
+import llm_main
+
+
+def test_llm_cache():
+    calls = []
+
+    def fake_generate_code(user_command):
+        calls.append(user_command)
+        return 'print("square")'
+
+    llm_main.llm_agent.generate_code = fake_generate_code
+    llm_main.llm_agent.reset_conversation()
+    llm_main._CODE_CACHE.clear()
+
+    request = {"command": "정사각형으로 움직여줘", "execute": False}
+    asyncio.run(llm_main.llm_command(dict(request)))
+    asyncio.run(llm_main.llm_command(dict(request)))
+
+    assert len(calls) == 1, f"Expected one generate_code call, got {len(calls)}"
+    assert len(llm_main.llm_agent.conversation_history) == 4, "Both turns should be recorded"
+
+    # no_cache always goes to the LLM
+    asyncio.run(llm_main.llm_command({**request, "no_cache": True}))
+    assert len(calls) == 2, f"Expected no_cache to call generate_code, got {len(calls)}"
+
+    print("SUCCESS: Identical commands generated once.")
+
+
+if __name__ == "__main__":
+    test_llm_cache()